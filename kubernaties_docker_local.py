@@ -1,86 +1,159 @@
 import os
 import time
+import functools
 import asyncio
 import logging,math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Matrix size used by the heavy computation.
+HEAVY_SIZE = 250
+
+# Maximum number of heavy computation tasks allowed to run concurrently.
+MAX_HEAVY_TASKS = 2
+
+# Seconds between heavy computation requests.
+HEAVY_REQUEST_INTERVAL = .01
+
+# Seconds to collect heavy computation requests before running them as one batch.
+# Spans several request intervals so each batch holds more than one request.
+HEAVY_BATCH_WINDOW = 5 * HEAVY_REQUEST_INTERVAL
 
 # Configure basic logging.
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s [%(levelname)s] %(message)s")
 
+# (i * j) % 1000 only takes 1000 distinct values, so sqrt(value + 1) is
+# precomputed once and looked up instead of being recomputed per element.
+_SQRT_LUT = [math.sqrt(value + 1) for value in range(1000)]
 
-async def heavy_computation():
+
+def _heavy_kernel(size):
     """
-    Perform a heavy computation that's both memory- and CPU-intensive:
-    
-    - Allocates a 1500x1500 matrix.
-    - Iterates over each element and computes the square root (adding 1 to vary the work).
+    Heavy computation: sum sqrt((i * j) % 1000 + 1) over a size x size grid.
+
+    Computes each (i * j) % 1000 value on the fly instead of allocating the matrix
+    and looks up sqrt(value + 1) in _SQRT_LUT.
     """
-    size = 250
-    # Allocate a 2D matrix, which uses a significant amount of memory.
-    matrix = [[(i * j) % 1000 for j in range(size)] for i in range(size)]
     total = 0.0
-    for row in matrix:
-        await asyncio.sleep(0.01)  # Simulate some network io call.
-        for value in row:
-            total += math.sqrt(value + 1)
-    # logging.info(f"Heavy computation result: {total:.2f}")
+    for i in range(size):
+        # Sum each row from a generator, so nothing per row is kept around.
+        total += sum(_SQRT_LUT[(i * j) % 1000] for j in range(size))
     return total
 
-async def async_heavy_computation():
+
+def _heavy_batch(sizes):
+    """
+    Run _heavy_kernel for each entry in `sizes` and return the results in order.
+    Kept at module level so it can be pickled and sent to a worker process.
+    """
+    return [_heavy_kernel(size) for size in sizes]
+
+
+def _new_heavy_pool():
+    """
+    Create the worker pool for heavy computation batches.
+    Workers are spawned rather than forked so they don't inherit this
+    process's threads and locks.
+    """
+    return ProcessPoolExecutor(max_workers=MAX_HEAVY_TASKS,
+                               mp_context=multiprocessing.get_context("spawn"))
+
+def _log_failure(future):
+    """
+    Done-callback for a heavy computation batch: log why it failed, if it did.
+    """
+    if not future.cancelled() and future.exception() is not None:
+        logging.error("Heavy computation batch failed: %r", future.exception())
+
+def _release_slot(semaphore, future):
     """
-    Wrap the heavy computation into an asynchronous callable.
-    This will offload the CPU-bound heavy task to a background thread.
+    Done-callback for a heavy computation batch: free its slot in `semaphore`.
     """
-    return await asyncio.to_thread(heavy_computation)
+    semaphore.release()
 
 async def heavy_computation_background():
     """
-    Schedule the heavy computation as a background task using asyncio.create_task.
+    Keep generating heavy computation load in the background.
     
-    Every second, a new heavy computation task is created.
-    The task's result is logged when it completes via a callback.
+    A heavy computation request is made every HEAVY_REQUEST_INTERVAL. Requests arriving within
+    HEAVY_BATCH_WINDOW are grouped and run as one batch in a worker process.
+    Worker processes don't share the GIL with the event loop, so the monitoring
+    coroutine keeps its timing. At most MAX_HEAVY_TASKS batches run at
+    once; the loop waits for a free slot before collecting the next batch so
+    unfinished work can't pile up in memory. If a worker dies (for example,
+    killed by the OOM killer), the pool is replaced so the load keeps coming.
     """
-    while True:
-        # Create the heavy task without awaiting its completion.
-        # task = asyncio.create_task(async_heavy_computation())
-        task = asyncio.create_task(heavy_computation())
-        # Use a callback to log the result when the task is done.
-        # task.add_done_callback(lambda t: logging.info(f"Heavy computation result: {t.result():.2f}"))
-        # Immediately move on and schedule the next task.
-        await asyncio.sleep(.01)
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(MAX_HEAVY_TASKS)
+    # Build the release callback once instead of a new closure per batch.
+    release_slot = functools.partial(_release_slot, semaphore)
+    pool = _new_heavy_pool()
+    try:
+        while True:
+            # Wait for a free slot, then collect the requests for the next batch.
+            await semaphore.acquire()
+            sizes = []
+            batch_deadline = loop.time() + HEAVY_BATCH_WINDOW
+            while True:
+                sizes.append(HEAVY_SIZE)
+                # Immediately move on and make the next request.
+                await asyncio.sleep(HEAVY_REQUEST_INTERVAL)
+                if loop.time() >= batch_deadline:
+                    break
+            # Run the batch in a worker process so the monitoring coroutine keeps
+            # waking up on time.
+            try:
+                future = loop.run_in_executor(pool, _heavy_batch, sizes)
+            except BrokenProcessPool:
+                # A worker died and the pool refuses all new work from then on,
+                # so replace it instead of silently dropping every later batch.
+                logging.error("Heavy computation worker died; restarting the worker pool.")
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _new_heavy_pool()
+                future = loop.run_in_executor(pool, _heavy_batch, sizes)
+            # Release the slot once the batch finishes, whatever its outcome.
+            future.add_done_callback(release_slot)
+            # Use a callback to log the failure when the batch is done.
+            future.add_done_callback(_log_failure)
+    finally:
+        pool.shutdown(cancel_futures=True)
 
+# Detect the cgroup layout once; every reader below is picked for it
+# instead of probing both the v1 and v2 paths on each call.
+_CGROUP = "v2" if os.path.exists("/sys/fs/cgroup/cgroup.controllers") else "v1"
+
+
+@functools.lru_cache(maxsize=1)
 def get_cpu_limit():
     """
     Determine the container's CPU limit.
     
-    - First, try cgroup v1 using:
+    - For cgroup v1, read:
          /sys/fs/cgroup/cpu/cpu.cfs_quota_us and /sys/fs/cgroup/cpu/cpu.cfs_period_us
-    - If unavailable, try cgroup v2 from:
+    - For cgroup v2, read:
          /sys/fs/cgroup/cpu.max
     
     Returns the fraction of a full CPU allocated (for example, 0.25 if the container is limited to 25% of one CPU).
     If no limit is found, returns 1.0.
     """
-    # Try cgroup v1.
-    cgroup_v1_quota = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
-    cgroup_v1_period = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
-    if os.path.exists(cgroup_v1_quota) and os.path.exists(cgroup_v1_period):
+    if _CGROUP == "v1":
         try:
-            with open(cgroup_v1_quota, "r") as f:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as f:
                 quota = int(f.read().strip())
-            with open(cgroup_v1_period, "r") as f:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as f:
                 period = int(f.read().strip())
             if quota == -1 or quota <= 0:
                 return 1.0
             return quota / period
+        except FileNotFoundError:
+            pass
         except Exception as e:
             logging.error(f"Error reading CPU limit (cgroup v1): {e}")
-
-    # Try cgroup v2.
-    cgroup_v2 = "/sys/fs/cgroup/cpu.max"
-    if os.path.exists(cgroup_v2):
+    else:
         try:
-            with open(cgroup_v2, "r") as f:
+            with open("/sys/fs/cgroup/cpu.max", "r") as f:
                 content = f.read().strip()
                 parts = content.split()
                 if parts[0] == "max":
@@ -91,86 +164,133 @@ def get_cpu_limit():
                     if quota <= 0:
                         return 1.0
                     return quota / period
+        except FileNotFoundError:
+            pass
         except Exception as e:
             logging.error(f"Error reading CPU limit (cgroup v2): {e}")
     
     return 1.0
 
 
-def read_cpu_usage():
+def _open_first(paths):
+    """
+    Open the first existing path in `paths` read-only and return its file descriptor.
+
+    Returns None if none of the paths exist. The cgroup files never move while the
+    container runs, so the descriptor can be kept open and re-read with os.pread.
     """
-    Read the cumulative CPU usage in nanoseconds.
-    
-    First, try the common cgroup v1 paths.
-    If not available, try cgroup v2—by reading /sys/fs/cgroup/cpu.stat and parsing the "usage_usec" value,
-    then converting microseconds to nanoseconds.
-    """
-    # Try cgroup v1 paths.
-    paths = [
-        "/sys/fs/cgroup/cpu,cpuacct/cpuacct.usage",
-        "/sys/fs/cgroup/cpuacct/cpuacct.usage"
-    ]
     for path in paths:
-        if os.path.exists(path):
-            try:
-                with open(path, "r") as f:
-                    return int(f.read().strip())
-            except Exception as e:
-                logging.error(f"Error reading CPU usage from {path}: {e}")
-    
-    # Try cgroup v2.
-    alt_path = "/sys/fs/cgroup/cpu.stat"
-    if os.path.exists(alt_path):
         try:
-            with open(alt_path, "r") as f:
-                lines = f.read().strip().splitlines()
-                usage_usec = None
-                for line in lines:
-                    if line.startswith("usage_usec"):
-                        parts = line.split()
-                        usage_usec = int(parts[1])
-                        break
-                if usage_usec is not None:
-                    return usage_usec * 1000  # Convert microseconds to nanoseconds.
+            return os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
         except Exception as e:
-            logging.error(f"Error reading CPU usage from {alt_path}: {e}")
+            logging.error(f"Error opening {path}: {e}")
+    return None
+
+
+def _read_unavailable():
+    """Reader used when the cgroup file could not be opened."""
     return 0
 
 
+def _read_cpu_usage_v1(fd):
+    """Read cpuacct.usage, which already holds nanoseconds."""
+    try:
+        return int(os.pread(fd, 128, 0).split(b"\n", 1)[0])
+    except Exception as e:
+        logging.error(f"Error reading CPU usage (cgroup v1): {e}")
+    return 0
+
+
+def _read_cpu_usage_v2(fd):
+    """Read "usage_usec" from cpu.stat and convert it to nanoseconds."""
+    try:
+        # "usage_usec" is always the first line of cpu.stat in cgroup v2.
+        first_line = os.pread(fd, 256, 0).partition(b"\n")[0]
+        name, _, value = first_line.partition(b" ")
+        if name == b"usage_usec":
+            return int(value) * 1000  # Convert microseconds to nanoseconds.
+    except Exception as e:
+        logging.error(f"Error reading CPU usage (cgroup v2): {e}")
+    return 0
+
+
+def _read_memory_usage_file(fd):
+    """Read memory.usage_in_bytes (v1) or memory.current (v2); both hold a single byte count."""
+    try:
+        return int(os.pread(fd, 128, 0).split(b"\n", 1)[0])
+    except Exception as e:
+        logging.error(f"Error reading memory usage: {e}")
+    return 0
+
+
+@functools.lru_cache(maxsize=1)
+def _cgroup_readers():
+    """
+    Open the cgroup usage files and return the (cpu, memory) readers bound to them.
+
+    Done on first use rather than at import: spawned heavy computation workers
+    re-import this module and never read the cgroup files.
+    """
+    if _CGROUP == "v2":
+        cpu_fd = _open_first(["/sys/fs/cgroup/cpu.stat"])
+        memory_fd = _open_first(["/sys/fs/cgroup/memory.current"])
+        read_cpu = _read_cpu_usage_v2
+    else:
+        cpu_fd = _open_first([
+            "/sys/fs/cgroup/cpu,cpuacct/cpuacct.usage",
+            "/sys/fs/cgroup/cpuacct/cpuacct.usage"
+        ])
+        memory_fd = _open_first(["/sys/fs/cgroup/memory/memory.usage_in_bytes"])
+        read_cpu = _read_cpu_usage_v1
+
+    cpu_reader = functools.partial(read_cpu, cpu_fd) if cpu_fd is not None else _read_unavailable
+    memory_reader = (functools.partial(_read_memory_usage_file, memory_fd)
+                     if memory_fd is not None else _read_unavailable)
+    return cpu_reader, memory_reader
+
+
+def read_cpu_usage():
+    """
+    Read the cumulative CPU usage in nanoseconds.
+    
+    For cgroup v1 this is cpuacct.usage. For cgroup v2 it is the "usage_usec" value
+    from /sys/fs/cgroup/cpu.stat, converted from microseconds to nanoseconds.
+    Returns 0 if the file is not available.
+    """
+    return _cgroup_readers()[0]()
+
+
 def read_memory_usage():
     """
     Read the container's memory usage in bytes.
     
-    Try the cgroup v1 file first and if not available, fallback to the cgroup v2 file.
+    Uses the cgroup v1 or v2 file depending on the detected layout; returns 0 if it is not available.
     """
-    paths = [
-        "/sys/fs/cgroup/memory/memory.usage_in_bytes",  # cgroup v1
-        "/sys/fs/cgroup/memory.current"                  # cgroup v2
-    ]
-    for path in paths:
-        if os.path.exists(path):
-            try:
-                with open(path, "r") as f:
-                    return int(f.read().strip())
-            except Exception as e:
-                logging.error(f"Error reading memory usage from {path}: {e}")
-    return 0
+    return _cgroup_readers()[1]()
 
+@functools.lru_cache(maxsize=1)
 def get_total_memory_in_bytes():
-    # with open('/sys/fs/cgroup/memory/memory', 'r') as f:
-    #     print(f.read())
-
-    paths = [
-        "/sys/fs/cgroup/memory/memory.max",  # cgroup v1
-        "/sys/fs/cgroup/memory.max"                  # cgroup v2
-    ]
-    for path in paths:
-        if os.path.exists(path):
-            try:
-                with open(path, "r") as f:
-                    return int(f.read().strip())
-            except Exception as e:
-                logging.error(f"Error reading memory usage from {path}: {e}")
+    """
+    Read the container's memory limit in bytes from the file for the detected cgroup version.
+    If no limit is set ("max" in cgroup v2), returns the host's physical memory.
+    Returns 1 if it can't be read.
+    """
+    if _CGROUP == "v2":
+        path = "/sys/fs/cgroup/memory.max"
+    else:
+        path = "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+    try:
+        with open(path, "r") as f:
+            content = f.read().strip()
+        if content == "max":
+            return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        return int(content)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.error(f"Error reading memory limit from {path}: {e}")
     return 1
 
 async def monitor_resources():
@@ -187,44 +307,43 @@ async def monitor_resources():
       - It reads the memory usage in bytes and converts it to megabytes.
     """
     cpu_limit = get_cpu_limit()
-    logging.info(f"Detected container CPU limit: {cpu_limit:.2f} CPUs")
+    logging.info("Detected container CPU limit: %.2f CPUs", cpu_limit)
     
+    # The memory limit is fixed when the container is created, so read it once.
+    total_memory_in_bytes = get_total_memory_in_bytes()
+    total_memory_in_mb = total_memory_in_bytes / (1024 ** 2)
+    logging.info("Detected container memory limit: %.2f MB", total_memory_in_mb)
+
     prev_cpu = read_cpu_usage()
-    prev_time = time.monotonic()
+    prev_time_ns = time.monotonic_ns()
 
     while True:
         await asyncio.sleep(1)  # 1-second monitoring interval.
         current_cpu = read_cpu_usage()
-        current_time = time.monotonic()
+        current_time_ns = time.monotonic_ns()
 
-        delta_cpu = current_cpu - prev_cpu       # in nanoseconds.
-        delta_time = current_time - prev_time      # in seconds.
+        delta_cpu = current_cpu - prev_cpu                # in nanoseconds.
+        delta_time_ns = current_time_ns - prev_time_ns    # in nanoseconds.
 
-        # Convert delta CPU usage (nanoseconds) into seconds:
-        cpu_time_used = delta_cpu / 1e9
-        # Compute raw fraction of one CPU used during this interval.
-        raw_cpu_fraction = cpu_time_used / delta_time
-        raw_cpu_percent = raw_cpu_fraction * 100.0
+        # Both deltas are integer nanoseconds, so the raw percent of one CPU
+        # used during this interval needs a single division.
+        raw_cpu_percent = (delta_cpu * 100.0) / delta_time_ns
 
         # Scale raw CPU percent by the container's limit:
         effective_cpu_percent = (raw_cpu_percent / cpu_limit) if cpu_limit > 0 else raw_cpu_percent
 
         mem_usage = read_memory_usage()
         mem_usage_mb = mem_usage / (1024 ** 2)
-        total_memory_in_bytes = get_total_memory_in_bytes()
-        total_memory_in_mb = total_memory_in_bytes / (1024 ** 2)
-        print(f"Total memory: {total_memory_in_mb} bytes")
         memory_usage_percentage = (mem_usage_mb / total_memory_in_mb) * 100
-        print(f"Memory usage percentage: {memory_usage_percentage:.2f}%")
 
-        logging.info(f"Raw CPU percent: {raw_cpu_percent:.2f}%, "
-                     f"Effective CPU percent: {effective_cpu_percent:.2f}%, "
-                     f"Memory usage: {mem_usage_mb:.2f} MB"
-                     f"Memory usage percentage: {memory_usage_percentage:.2f}%"
-                     )
+        # Pass values as arguments so the message is only formatted if it's emitted.
+        logging.info("Raw CPU percent: %.2f%%, Effective CPU percent: %.2f%%, "
+                     "Memory usage: %.2f MB, Memory usage percentage: %.2f%%",
+                     raw_cpu_percent, effective_cpu_percent,
+                     mem_usage_mb, memory_usage_percentage)
 
         prev_cpu = current_cpu
-        prev_time = current_time
+        prev_time_ns = current_time_ns
 
 
 async def main():
@@ -1,53 +1,143 @@
 import os
-import docker
 import asyncio
+import functools
 import logging
-import math
+import aiohttp
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from numba import vectorize
+
+# Prefer orjson for parsing Docker stats; fall back to the standard library.
+try:
+    import orjson as json
+except ImportError:
+    import json
+
+# Matrix size used by the heavy computation.
+HEAVY_SIZE = 1500
+
+# Maximum number of heavy computation tasks allowed to run concurrently.
+MAX_HEAVY_TASKS = 2
+
+# Seconds between heavy computation requests.
+HEAVY_REQUEST_INTERVAL = .1
+
+# Seconds to collect heavy computation requests before running them as one batch.
+# Spans several request intervals so each batch holds more than one request.
+HEAVY_BATCH_WINDOW = 5 * HEAVY_REQUEST_INTERVAL
+
+# Docker Engine API socket, mounted into the container by docker-compose.
+DOCKER_SOCKET = "/var/run/docker.sock"
 
 # Configure logging to include timestamps and log level.
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
+# (i * j) % 1000 only takes 1000 distinct values, so sqrt(value + 1) is
+# precomputed once and looked up instead of being recomputed per element.
+_SQRT_LUT = np.sqrt(np.arange(1, 1001, dtype=np.float64))
 
-async def heavy_computation():
+
+@vectorize(["f8(i8)"], target="cpu", fastmath=True, cache=True)
+def _heavy_batch(size):
     """
-    Perform a heavy computation that's both memory- and CPU-intensive:
-    
-    - Allocates a 1500x1500 matrix.
-    - Iterates over each element and computes the square root (adding 1 to vary the work).
+    Heavy computation, applied element-wise to an array of sizes.
+
+    For each size, sums sqrt((i * j) % 1000 + 1) over a size x size grid by
+    looking the square roots up in _SQRT_LUT, without materialising the matrix.
+    Elements run one after another on the calling thread; parallelism comes
+    from the worker processes in main()'s pool, one batch per worker.
     """
-    size = 1500
-    # Allocate a 2D matrix, which uses a significant amount of memory.
-    matrix = [[(i * j) % 1000 for j in range(size)] for i in range(size)]
     total = 0.0
-    for row in matrix:
-        await asyncio.sleep(0.001)  # Simulate some network io call.
-        for value in row:
-            total += math.sqrt(value + 1)
-    logging.info(f"Heavy computation result: {total:.2f}")
+    for i in range(size):
+        for j in range(size):
+            total += _SQRT_LUT[(i * j) % 1000]
     return total
 
-async def async_heavy_computation():
+
+def _heavy_sync(sizes):
+    """
+    Run several heavy computations in a single _heavy_batch call.
+    Kept at module level so it can be pickled and sent to a worker process.
+    """
+    return _heavy_batch(np.asarray(sizes, dtype=np.int64)).tolist()
+
+def _new_heavy_pool():
+    """
+    Create the worker pool for heavy computation batches.
+    Workers are spawned rather than forked so they don't inherit this
+    process's threads and locks.
+    """
+    return ProcessPoolExecutor(max_workers=MAX_HEAVY_TASKS,
+                               mp_context=multiprocessing.get_context("spawn"))
+
+def _log_done(future):
+    """
+    Done-callback for a heavy computation batch: log each result, or why the batch failed.
+    """
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logging.error("Heavy computation batch failed: %r", error)
+        return
+    for result in future.result():
+        logging.info("Heavy computation result: %.2f", result)
+
+def _release_slot(semaphore, future):
     """
-    Wrap the heavy computation into an asynchronous callable.
-    This will offload the CPU-bound heavy task to a background thread.
+    Done-callback for a heavy computation batch: free its slot in `semaphore`.
     """
-    return await asyncio.to_thread(heavy_computation)
+    semaphore.release()
 
 async def heavy_computation_background():
     """
-    Schedule the heavy computation as a background task using asyncio.create_task.
+    Keep generating heavy computation load in the background.
     
-    Every second, a new heavy computation task is created.
-    The task's result is logged when it completes via a callback.
-    """
-    while True:
-        # Create the heavy task without awaiting its completion.
-        # task = asyncio.create_task(async_heavy_computation())
-        task = asyncio.create_task(heavy_computation())
-        # Use a callback to log the result when the task is done.
-        task.add_done_callback(lambda t: logging.info(f"Heavy computation result: {t.result():.2f}"))
-        # Immediately move on and schedule the next task.
-        await asyncio.sleep(.1)
+    A heavy computation request is made every HEAVY_REQUEST_INTERVAL. Requests arriving within
+    HEAVY_BATCH_WINDOW are grouped and run as one batch in a worker process.
+    Worker processes don't share the GIL with the event loop, so the monitoring
+    coroutine keeps its timing. At most MAX_HEAVY_TASKS batches run at
+    once; the loop waits for a free slot before collecting the next batch so
+    unfinished work can't pile up in memory. If a worker dies (for example,
+    killed by the OOM killer), the pool is replaced so the load keeps coming.
+    The batch's results are logged when it completes via a callback.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(MAX_HEAVY_TASKS)
+    # Build the release callback once instead of a new closure per batch.
+    release_slot = functools.partial(_release_slot, semaphore)
+    pool = _new_heavy_pool()
+    try:
+        while True:
+            # Wait for a free slot, then collect the requests for the next batch.
+            await semaphore.acquire()
+            sizes = []
+            batch_deadline = loop.time() + HEAVY_BATCH_WINDOW
+            while True:
+                sizes.append(HEAVY_SIZE)
+                # Immediately move on and make the next request.
+                await asyncio.sleep(HEAVY_REQUEST_INTERVAL)
+                if loop.time() >= batch_deadline:
+                    break
+            # Run the batch in a worker process so the monitoring coroutine keeps
+            # waking up on time.
+            try:
+                future = loop.run_in_executor(pool, _heavy_sync, sizes)
+            except BrokenProcessPool:
+                # A worker died and the pool refuses all new work from then on,
+                # so replace it instead of silently dropping every later batch.
+                logging.error("Heavy computation worker died; restarting the worker pool.")
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _new_heavy_pool()
+                future = loop.run_in_executor(pool, _heavy_sync, sizes)
+            # Release the slot once the batch finishes, whatever its outcome.
+            future.add_done_callback(release_slot)
+            # Use a callback to log the results when the batch is done.
+            future.add_done_callback(_log_done)
+    finally:
+        pool.shutdown(cancel_futures=True)
 
 def get_cpu_limit():
     """
@@ -100,25 +190,23 @@ def calculate_cpu_percent(stats):
        Δsystem_cpu_usage    = cpu_stats.system_cpu_usage − precpu_stats.system_cpu_usage
     """
     try:
-        cpu_stats = stats.get("cpu_stats", {})
-        precpu_stats = stats.get("precpu_stats", {})
-        
-        if not precpu_stats or not precpu_stats.get("cpu_usage", {}).get("total_usage"):
-            return 0.0
+        cpu_stats = stats["cpu_stats"]
+        precpu_stats = stats["precpu_stats"]
+        cpu_usage = cpu_stats["cpu_usage"]
 
-        total_usage_current = cpu_stats["cpu_usage"]["total_usage"]
         total_usage_prev = precpu_stats["cpu_usage"]["total_usage"]
-        delta_container = total_usage_current - total_usage_prev
-        
-        system_cpu_current = cpu_stats.get("system_cpu_usage", 0)
-        system_cpu_prev = precpu_stats.get("system_cpu_usage", 0)
-        delta_system = system_cpu_current - system_cpu_prev
+        if not total_usage_prev:
+            # The first sample has no previous reading to compare against.
+            return 0.0
+
+        delta_container = cpu_usage["total_usage"] - total_usage_prev
+        delta_system = cpu_stats["system_cpu_usage"] - precpu_stats["system_cpu_usage"]
 
         if delta_system > 0 and delta_container > 0:
-            online_cpus = cpu_stats.get("online_cpus") or len(cpu_stats["cpu_usage"].get("percpu_usage", [])) or 1
+            online_cpus = cpu_stats.get("online_cpus") or len(cpu_usage.get("percpu_usage", ())) or 1
             return (delta_container / delta_system) * online_cpus * 100.0
-    except Exception as e:
-        logging.error(f"Error calculating CPU percent: {e}")
+    except KeyError as e:
+        logging.error(f"Missing field {e} in Docker stats while calculating CPU percent")
     return 0.0
 
 async def monitor_own_container():
@@ -126,8 +214,8 @@ async def monitor_own_container():
     Monitor the resource usage (CPU and memory) for this container.
     
     The container is identified via the HOSTNAME environment variable.
-    Docker stats are fetched every second. The function calculates the raw CPU usage
-    using the formula:
+    Docker stats are fetched every second straight from the Docker Engine API socket.
+    The function calculates the raw CPU usage using the formula:
     
        CPU% = (Δcontainer_total_usage/Δsystem_cpu_usage) × number_of_cpus × 100
     
@@ -135,50 +223,64 @@ async def monitor_own_container():
     so that if the container (e.g., limited to 0.25 CPU) is fully utilized, the effective CPU usage
     is reported as 100%.
     """
-    client = docker.from_env()
     container_id = os.environ.get("HOSTNAME")  # Typically, inside a container HOSTNAME is its ID.
     
     if not container_id:
         logging.error("HOSTNAME environment variable not found. Cannot determine container ID.")
         return
 
-    try:
-        container = client.containers.get(container_id)
-    except Exception as e:
-        logging.error(f"Error retrieving container '{container_id}': {e}")
-        return
+    # Talk to the Docker Engine API directly over its unix socket with one persistent session.
+    connector = aiohttp.UnixConnector(path=DOCKER_SOCKET)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        try:
+            async with session.get(f"http://localhost/containers/{container_id}/json") as response:
+                response.raise_for_status()
+        except Exception as e:
+            logging.error(f"Error retrieving container '{container_id}': {e}")
+            return
 
-    # Determine the container's CPU limit.
-    cpu_limit = get_cpu_limit()
-    logging.info(f"Detected container CPU limit: {cpu_limit:.2f}")
+        # Determine the container's CPU limit.
+        cpu_limit = get_cpu_limit()
+        logging.info(f"Detected container CPU limit: {cpu_limit:.2f}")
 
-    while True:
-        try:
-            # Get a snapshot of the container stats.
-            stats = await asyncio.to_thread(container.stats, stream=False)
-            if isinstance(stats, list):
-                stats = stats[0]  # Use the first snapshot if a list is returned.
+        # one-shot=true returns immediately instead of waiting for Docker's second sample.
+        stats_url = f"http://localhost/containers/{container_id}/stats?stream=false&one-shot=true"
+        prev_cpu_stats = None
+
+        while True:
+            try:
+                # Get a snapshot of the container stats.
+                async with session.get(stats_url) as response:
+                    response.raise_for_status()
+                    stats = json.loads(await response.read())
+
+                # A one-shot snapshot carries no previous CPU sample, so use our own
+                # reading from the last tick as precpu_stats.
+                if prev_cpu_stats is not None:
+                    stats["precpu_stats"] = prev_cpu_stats
+                prev_cpu_stats = stats["cpu_stats"]
+
+                cpu_usage = stats["cpu_stats"]["cpu_usage"]["total_usage"]
+                mem_usage_bytes = stats["memory_stats"]["usage"]
+                mem_limit_bytes = stats["memory_stats"]["limit"]
+
+                mem_usage_mb = mem_usage_bytes / (1024 ** 2)
+                mem_limit_mb = mem_limit_bytes / (1024 ** 2)
+
+                raw_cpu_percent = calculate_cpu_percent(stats)
+                # Scale raw usage by the detected CPU limit.
+                effective_cpu_percent = raw_cpu_percent / cpu_limit if cpu_limit > 0 else raw_cpu_percent
+
+                logging.info(
+                    "[Self] CPU usage: %s, Raw CPU percent: %.2f%%, "
+                    "Effective CPU percent: %.2f%%, Memory: %.2f MB / %.2f MB",
+                    cpu_usage, raw_cpu_percent, effective_cpu_percent,
+                    mem_usage_mb, mem_limit_mb
+                )
+            except Exception as e:
+                logging.error(f"Error fetching container stats: {e}")
             
-            cpu_usage = stats["cpu_stats"]["cpu_usage"]["total_usage"]
-            mem_usage_bytes = stats["memory_stats"]["usage"]
-            mem_limit_bytes = stats["memory_stats"]["limit"]
-
-            mem_usage_mb = mem_usage_bytes / (1024 ** 2)
-            mem_limit_mb = mem_limit_bytes / (1024 ** 2)
-
-            raw_cpu_percent = calculate_cpu_percent(stats)
-            # Scale raw usage by the detected CPU limit.
-            effective_cpu_percent = raw_cpu_percent / cpu_limit if cpu_limit > 0 else raw_cpu_percent
-
-            logging.info(
-                f"[Self] CPU usage: {cpu_usage}, Raw CPU percent: {raw_cpu_percent:.2f}%, "
-                f"Effective CPU percent: {effective_cpu_percent:.2f}%, "
-                f"Memory: {mem_usage_mb:.2f} MB / {mem_limit_mb:.2f} MB"
-            )
-        except Exception as e:
-            logging.error(f"Error fetching container stats: {e}")
-        
-        await asyncio.sleep(1)
+            await asyncio.sleep(1)
 
 async def main():
     # Run both the container monitoring and heavy computation background tasks concurrently.